@@ -1,7 +1,9 @@
 import streamlit as st
 from datetime import datetime
 from news_service import NewsService
-from utils import inject_custom_css, inject_swipe_detection, inject_pwa_html, inject_pwa_detection, is_pwa, log_to_console, inject_visibility_auto_fetch
+from news_index import build_feed_index, select_feed_order, SORT_DEFAULT, SORT_LABELS, ALL_TOPICS
+from view_state_store import get_view_state_store, compact_read_snos
+from utils import inject_custom_css, inject_swipe_detection, inject_pwa_html, inject_pwa_detection, is_pwa, log_to_console, inject_visibility_auto_fetch, inject_client_token
 
 # ====== 配置與設定 ======
 st.set_page_config(page_title="Web3 News", page_icon="📰", layout="centered")
@@ -9,6 +11,7 @@ st.set_page_config(page_title="Web3 News", page_icon="📰", layout="centered")
 # 注入 PWA 支援（清單與 Service Worker）
 inject_pwa_html()
 inject_pwa_detection()
+inject_client_token()
 
 inject_custom_css()
 inject_swipe_detection()
@@ -36,6 +39,21 @@ if "comment_success_msg" not in st.session_state:
     st.session_state.comment_success_msg = None
 if "comment_error_msg" not in st.session_state:
     st.session_state.comment_error_msg = None
+# 排序／篩選：feed_order 為目前瀏覽順序（today_rows 的列位置），current_index 是其游標
+if "feed_index" not in st.session_state:
+    st.session_state.feed_index = None
+if "feed_order" not in st.session_state:
+    st.session_state.feed_order = []
+if "sort_mode" not in st.session_state:
+    st.session_state.sort_mode = SORT_DEFAULT
+if "topic_filter" not in st.session_state:
+    st.session_state.topic_filter = ALL_TOPICS
+if "only_unread" not in st.session_state:
+    st.session_state.only_unread = False
+if "only_uncommented" not in st.session_state:
+    st.session_state.only_uncommented = False
+if "read_snos" not in st.session_state:
+    st.session_state.read_snos = {}  # {日期字串: set(sno)}
 
 # ====== 輔助函式 ======
 def rerun():
@@ -55,11 +73,56 @@ else:
     cache_decorator = st.cache(ttl=1800, show_spinner=False, suppress_st_warning=True)
 
 @cache_decorator
-def get_cached_news(date_str):
-    """包裝新聞資料快取以避免重複呼叫 Webhook。"""
+def get_cached_news(date_str, _refresh=False):
+    """包裝新聞資料快取以避免重複呼叫 Webhook（_refresh 不列入快取鍵，僅用於略過本地封存）。"""
     # 在此實例化服務以確保它是乾淨的，且不依賴傳遞 session_state
     service = NewsService()
-    return service.fetch_news(date_str)
+    result = service.fetch_news(date_str, refresh=_refresh)
+    # 排序／主題索引只在載入資料時計算一次，與資料一起快取
+    if result["status"] == "success" and "data" in result:
+        result["feed_index"] = build_feed_index(result["data"])
+    return result
+
+def apply_feed_order(reset_cursor=False, keep_sno=None):
+    """
+    依排序與篩選條件重新計算瀏覽順序（僅在條件或資料變更時執行，而非每次 Rerun）。
+    keep_sno 指定的那則即使已讀也保留在順序中；未重設游標時預設保留目前這則。
+    """
+    rows = st.session_state.today_rows
+    order = st.session_state.feed_order
+    idx = st.session_state.current_index
+    current_position = None if reset_cursor or not (0 <= idx < len(order)) else order[idx]
+    if keep_sno is None and current_position is not None and current_position < len(rows):
+        keep_sno = rows[current_position].get("sno")
+
+    if st.session_state.feed_index and rows:
+        new_order = select_feed_order(
+            st.session_state.feed_index,
+            rows,
+            sort_mode=st.session_state.sort_mode,
+            topic=st.session_state.topic_filter,
+            only_unread=st.session_state.only_unread,
+            only_uncommented=st.session_state.only_uncommented,
+            read_snos=st.session_state.read_snos.get(st.session_state.current_date),
+            keep_sno=keep_sno,
+        )
+    else:
+        new_order = []
+
+    st.session_state.feed_order = new_order
+    # 若目前這則仍在新順序中，停留在同一則
+    if current_position is not None and current_position in new_order:
+        st.session_state.current_index = new_order.index(current_position)
+    else:
+        st.session_state.current_index = 0
+
+def sync_feed_setting(name, reset_cursor):
+    """
+    將控制項（key 為 name + "_widget"）的值寫回持久的設定鍵後重新計算順序。
+    控制項未顯示時 Streamlit 會清除其 key，因此設定另存於非控制項的鍵中。
+    """
+    st.session_state[name] = st.session_state[f"{name}_widget"]
+    apply_feed_order(reset_cursor=reset_cursor)
 
 def handle_update(force_refresh=False):
     """從 n8n 獲取新聞。"""
@@ -70,7 +133,8 @@ def handle_update(force_refresh=False):
         get_cached_news.clear()
     
     # 使用快取包裝器獲取新聞
-    result = get_cached_news(date_str)
+    # 強制重新整理時也略過本地封存，直接向 n8n 取得最新資料
+    result = get_cached_news(date_str, _refresh=force_refresh)
     
     # 獲取今日日期進行比較
     today = datetime.today().date()
@@ -81,6 +145,10 @@ def handle_update(force_refresh=False):
             st.session_state.today_rows = result["data"]
             st.session_state.current_index = 0
             st.session_state.current_date = date_str
+            st.session_state.feed_index = result.get("feed_index") or build_feed_index(result["data"])
+            if st.session_state.topic_filter not in st.session_state.feed_index["topic_names"]:
+                st.session_state.topic_filter = ALL_TOPICS
+            apply_feed_order(reset_cursor=True)
             
             # 檢查資料是否為空並設定適當訊息
             if not st.session_state.today_rows:
@@ -101,6 +169,8 @@ def handle_update(force_refresh=False):
     else:
         # 警告或錯誤時清除資料
         st.session_state.today_rows = []
+        st.session_state.feed_index = None
+        st.session_state.feed_order = []
         
         if result["status"] == "warning":
             st.session_state.status_message = result["message"]
@@ -143,6 +213,74 @@ def handle_comment(row, comment_key):
         st.session_state.comment_error_msg = result["message"]
         st.session_state.comment_success_msg = None
 
+def restore_view_state():
+    """
+    取得 client token 後，以一次查詢還原上次的檢視狀態
+    （日期、游標、排序／篩選與已讀紀錄），並直接從快取載入該日新聞。
+    """
+    token = st.session_state.get("client_token")
+    if not token:
+        return
+    state = get_view_state_store().load(token)
+    if not state:
+        return
+    try:
+        st.session_state.selected_date = datetime.strptime(state["date"], "%Y/%m/%d").date()
+    except (KeyError, TypeError, ValueError):
+        return
+
+    if state.get("sort_mode") in SORT_LABELS:
+        st.session_state.sort_mode = state["sort_mode"]
+    st.session_state.topic_filter = state.get("topic_filter", ALL_TOPICS)
+    st.session_state.only_unread = bool(state.get("only_unread"))
+    st.session_state.only_uncommented = bool(state.get("only_uncommented"))
+    st.session_state.read_snos = {date_str: set(snos) for date_str, snos in state.get("read", {}).items()}
+
+    # 已還原即不需再由 StartAutoFetch 觸發更新
+    st.session_state.auto_fetched = True
+    result = handle_update()
+
+    # 將游標移回上次瀏覽的那一則；該則已標為已讀，需先讓它留在「只看未讀」的順序中
+    cursor_sno = state.get("cursor_sno")
+    if result["status"] == "success" and cursor_sno is not None:
+        apply_feed_order(reset_cursor=True, keep_sno=cursor_sno)
+        rows = st.session_state.today_rows
+        for idx, position in enumerate(st.session_state.feed_order):
+            if rows[position].get("sno") == cursor_sno:
+                st.session_state.current_index = idx
+                break
+
+def save_view_state():
+    """若檢視狀態有變更則寫回儲存（每次 Rerun 結束時呼叫）。"""
+    token = st.session_state.get("client_token")
+    if not token or not st.session_state.today_rows:
+        return
+    order = st.session_state.feed_order
+    idx = st.session_state.current_index
+    state = {
+        "date": st.session_state.current_date,
+        "cursor_sno": st.session_state.today_rows[order[idx]].get("sno") if 0 <= idx < len(order) else None,
+        "sort_mode": st.session_state.sort_mode,
+        "topic_filter": st.session_state.topic_filter,
+        "only_unread": st.session_state.only_unread,
+        "only_uncommented": st.session_state.only_uncommented,
+        "read": compact_read_snos(st.session_state.read_snos),
+    }
+    # 連同 token 比較：分享連結開啟時 token 會在下一次 Rerun 換成本瀏覽器自己的
+    if (token, state) != st.session_state.get("saved_view_state"):
+        try:
+            get_view_state_store().save(token, state)
+            st.session_state.saved_view_state = (token, state)
+        except Exception as e:
+            log_to_console(f"⚠️ save_view_state failed: {e}")
+
+# ====== 檢視狀態還原 ======
+# token 可能要到下一次 Rerun 才出現在網址中；出現後只還原一次，且不覆蓋已載入的資料
+if "view_state_restored" not in st.session_state and st.session_state.get("client_token"):
+    st.session_state.view_state_restored = True
+    if not st.session_state.today_rows:
+        restore_view_state()
+
 
 # ====== UI 函式 ======
 
@@ -222,6 +360,42 @@ def show_web_ui():
                         rerun()
                     else:
                         status_placeholder.error(result.get("message", "Unknown error"))
+
+        # 排序與篩選（有資料時才顯示）
+        if st.session_state.today_rows and st.session_state.feed_index:
+            # 控制項的值每次都由持久的設定鍵帶入；改變排序或主題時回到第一則
+            for name in ("sort_mode", "topic_filter", "only_unread", "only_uncommented"):
+                st.session_state[f"{name}_widget"] = st.session_state[name]
+            col_sort, col_topic = st.columns(2)
+            with col_sort:
+                st.selectbox(
+                    "排序",
+                    options=list(SORT_LABELS),
+                    format_func=lambda mode: SORT_LABELS[mode],
+                    key="sort_mode_widget",
+                    on_change=sync_feed_setting,
+                    args=("sort_mode", True),
+                )
+            with col_topic:
+                st.selectbox(
+                    "主題",
+                    options=[ALL_TOPICS] + st.session_state.feed_index["topic_names"],
+                    format_func=lambda topic: topic or "全部主題",
+                    key="topic_filter_widget",
+                    on_change=sync_feed_setting,
+                    args=("topic_filter", True),
+                )
+            col_unread, col_uncommented = st.columns(2)
+            with col_unread:
+                st.checkbox(
+                    "只看未讀", key="only_unread_widget",
+                    on_change=sync_feed_setting, args=("only_unread", False),
+                )
+            with col_uncommented:
+                st.checkbox(
+                    "只看未評論", key="only_uncommented_widget",
+                    on_change=sync_feed_setting, args=("only_uncommented", False),
+                )
     
     # 3. 狀態列（控制項下方）
     with status_container:
@@ -251,13 +425,21 @@ def show_web_ui():
                 unsafe_allow_html=True
             )
             st.markdown('</div>', unsafe_allow_html=True)
+        elif not st.session_state.feed_order:
+            # 有資料但篩選後沒有符合的新聞
+            st.markdown('<div class="status-area">🔍 沒有符合篩選條件的新聞</div>', unsafe_allow_html=True)
     
     # 4. 內容區域
     with content_container:
-        if st.session_state.today_rows:
-            total = len(st.session_state.today_rows)
-            idx = st.session_state.current_index
-            row = st.session_state.today_rows[idx]
+        if st.session_state.today_rows and st.session_state.feed_order:
+            order = st.session_state.feed_order
+            total = len(order)
+            idx = min(st.session_state.current_index, total - 1)
+            row = st.session_state.today_rows[order[idx]]
+            total_label = f"共 {total} 則" if total == len(st.session_state.today_rows) else f"共 {total} 則 / 全部 {len(st.session_state.today_rows)} 則"
+
+            # 標記為已讀
+            st.session_state.read_snos.setdefault(st.session_state.current_date, set()).add(row.get("sno"))
             
             # 卡片容器
             with st.container():
@@ -265,7 +447,7 @@ def show_web_ui():
                 <div class="news-card">
                     <div style="margin-bottom: 0.5rem;">
                         <span style="color: #4facfe; font-weight: bold; font-size: 1.5rem;">📅 {st.session_state.current_date}</span>
-                        <span style="color: #999; font-weight: normal; font-size: 0.95rem;">   [ 共 {total} 則 ]</span><br>
+                        <span style="color: #999; font-weight: normal; font-size: 0.95rem;">   [ {total_label} ]</span><br>
                         <span style="color: #4facfe; font-weight: bold; font-size: 1.5rem;">No.  {idx + 1}</span>
                     </div>
                     <h3>{row.get('標題', '無標題')}</h3>
@@ -287,7 +469,7 @@ def show_web_ui():
                         st.session_state.current_index -= 1
                         rerun()
                 with c2:
-                    if st.button("➡️ 下一則", key="btn_next", disabled=(st.session_state.current_index == len(st.session_state.today_rows) - 1)):
+                    if st.button("➡️ 下一則", key="btn_next", disabled=(st.session_state.current_index == len(order) - 1)):
                         st.session_state.current_index += 1
                         rerun()
 
@@ -325,3 +507,5 @@ if is_pwa():
     show_app_ui()
 else:
     show_web_ui()
+
+save_view_state()
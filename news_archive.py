@@ -0,0 +1,345 @@
+"""
+過去日期的本地封存：每個已結束的日期存成一個快照檔（zlib 壓縮的欄式 JSON），
+評論另記於附加式的 overlay 日誌，讀取時再套用到快照上。
+讀取時會整檔解壓並建立所有列，換得的是不需呼叫 n8n，而非零複製載入。
+
+路徑配置（依日期分區）：
+    <NEWS_ARCHIVE_DIR>/YYYY/MM/DD.snap
+    <NEWS_ARCHIVE_DIR>/comments.log
+
+一次性回填：
+    python news_archive.py backfill 2025/10/19 2026/10/18
+將 overlay 中的評論併入快照：
+    python news_archive.py compact
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+DEFAULT_ARCHIVE_DIR = "news_archive"
+
+SNAPSHOT_MAGIC = b"NEWSSNAP1\n"
+COMMENT_LOG = "comments.log"
+COMPACTING_LOG = "comments.log.compacting"
+
+
+def is_archivable(date_str, today=None):
+    """只有已結束（今天以前）的日期才會封存。"""
+    try:
+        selected = datetime.strptime(date_str, "%Y/%m/%d").date()
+    except (TypeError, ValueError):
+        return False
+    return selected < (today or datetime.today().date())
+
+
+def encode_snapshot(rows):
+    """
+    將列資料轉為欄式結構並壓縮：
+    {"columns": [...], "data": [[欄位值...], ...], "missing": {欄位序號: [列序號...]}, "n": 列數}。
+    missing 記錄哪些列沒有該欄位，讓還原結果與原始資料完全相同。
+    """
+    columns = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    data = []
+    missing = {}
+    for col, column in enumerate(columns):
+        values = []
+        for i, row in enumerate(rows):
+            if column in row:
+                values.append(row[column])
+            else:
+                values.append(None)
+                missing.setdefault(str(col), []).append(i)
+        data.append(values)
+    payload = json.dumps(
+        {"columns": columns, "data": data, "missing": missing, "n": len(rows)},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return SNAPSHOT_MAGIC + zlib.compress(payload.encode("utf-8"), 9)
+
+
+def decode_snapshot(buffer):
+    """從快照內容還原列資料。"""
+    if bytes(buffer[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+        raise ValueError("不是新聞快照檔")
+    payload = json.loads(zlib.decompress(buffer[len(SNAPSHOT_MAGIC):]))
+    columns = payload["columns"]
+    rows = [{} for _ in range(payload["n"])]
+    for col, (column, values) in enumerate(zip(columns, payload["data"])):
+        absent = set(payload.get("missing", {}).get(str(col), ()))
+        for i, value in enumerate(values):
+            if i not in absent:
+                rows[i][column] = value
+    return rows
+
+
+class NewsArchive:
+    """依日期分區的快照封存與評論 overlay。"""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._overlay = {}
+        self._overlay_stamp = None
+
+    def snapshot_path(self, date_str):
+        year, month, day = date_str.split("/")
+        return os.path.join(self.root, year, month, f"{day}.snap")
+
+    def has(self, date_str):
+        return os.path.exists(self.snapshot_path(date_str))
+
+    def store(self, date_str, rows, reset_comments=False):
+        """
+        原子性寫入快照（先寫同目錄下的唯一暫存檔再取代，同時寫入同一日期也不會互相覆蓋暫存檔）。
+        reset_comments=True 表示 rows 來自 n8n（已含所有評論），該日期先前的 overlay 評論不再套用。
+        """
+        path = self.snapshot_path(date_str)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(encode_snapshot(rows))
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        if reset_comments and self._comments_for(date_str):
+            self._append_log({"date": date_str, "reset": True, "ts": time.time()})
+
+    def _read_snapshot(self, date_str):
+        """
+        讀取並解碼快照（不含評論 overlay）；不存在時回傳 None。
+        快照損毀時刪除該檔並回傳 None，讓呼叫端改從 n8n 取得並重新寫入。
+        """
+        path = self.snapshot_path(date_str)
+        try:
+            with open(path, "rb") as f:
+                return decode_snapshot(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error, KeyError, TypeError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def load(self, date_str):
+        """讀取快照並套用評論 overlay；不存在或損毀時回傳 None。"""
+        rows = self._read_snapshot(date_str)
+        if rows is None:
+            return None
+
+        comments = self._comments_for(date_str)
+        if comments:
+            for row in rows:
+                if row.get("列號") in comments:
+                    row["評論"] = comments[row["列號"]]
+        return rows
+
+    def record_comment(self, date_str, row_index, comment):
+        """將評論附加到 overlay 日誌。"""
+        self._append_log({"date": date_str, "row": row_index, "comment": comment, "ts": time.time()})
+
+    def _append_log(self, entry):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            with open(os.path.join(self.root, COMMENT_LOG), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _comments_for(self, date_str):
+        """
+        回傳 {列號: 最新評論}；日誌檔未變更時沿用記憶體中的結果。
+        依序讀取整併中的日誌與目前的日誌，讓整併期間的評論仍然可見。
+        """
+        paths = [os.path.join(self.root, name) for name in (COMPACTING_LOG, COMMENT_LOG)]
+        stamp = tuple(_file_stamp(path) for path in paths)
+        if not any(stamp):
+            return {}
+        with self._lock:
+            if stamp != self._overlay_stamp:
+                overlay = {}
+                for path in paths:
+                    _read_log_into(path, overlay)
+                self._overlay = overlay
+                self._overlay_stamp = stamp
+            return self._overlay.get(date_str, {})
+
+    def compact(self):
+        """
+        將 overlay 中的評論併入各日期快照。回傳處理的日期數。
+        先把日誌改名為整併檔再處理，App 在此期間新增的評論會寫入新的日誌，不會遺失；
+        若上次整併中斷，會先處理留下的整併檔。
+        """
+        pending = os.path.join(self.root, COMPACTING_LOG)
+        count = 0
+        if os.path.exists(pending):
+            count += self._fold_log(pending)
+        try:
+            os.replace(os.path.join(self.root, COMMENT_LOG), pending)
+        except FileNotFoundError:
+            return count
+        return count + self._fold_log(pending)
+
+    def _fold_log(self, pending):
+        """
+        將整併檔中的評論寫入快照，完成後刪除整併檔。
+        整併期間若有日期重新從 n8n 取得（目前日誌出現 reset，或快照已被改寫），
+        新快照已含最新評論，略過該日期，避免以舊資料覆蓋。
+        """
+        overlay = {}
+        _read_log_into(pending, overlay)
+        count = 0
+        for date_str, comments in overlay.items():
+            if not comments:
+                continue
+            stamp = _file_stamp(self.snapshot_path(date_str))
+            rows = self._read_snapshot(date_str)
+            if rows is None:
+                continue
+            for row in rows:
+                if row.get("列號") in comments:
+                    row["評論"] = comments[row["列號"]]
+            # 寫入前再檢查一次，縮小與 App 重新整理同時發生的空窗
+            if date_str in _reset_dates(os.path.join(self.root, COMMENT_LOG)):
+                continue
+            if _file_stamp(self.snapshot_path(date_str)) != stamp:
+                continue
+            self.store(date_str, rows)
+            count += 1
+        os.remove(pending)
+        with self._lock:
+            self._overlay_stamp = None
+        return count
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _reset_dates(path):
+    """回傳日誌中出現過 reset 的日期；檔案不存在時回傳空集合。"""
+    dates = set()
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return dates
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get("reset"):
+                dates.add(entry.get("date"))
+    return dates
+
+
+def _read_log_into(path, overlay):
+    """將評論日誌依序套用到 overlay（{日期: {列號: 評論}}）；檔案不存在時略過。"""
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 略過寫入中斷的最後一行
+            if entry.get("reset"):
+                overlay[entry["date"]] = {}
+            else:
+                overlay.setdefault(entry["date"], {})[entry["row"]] = entry["comment"]
+
+
+_default_archive = None
+_default_archive_lock = threading.Lock()
+
+
+def get_default_archive():
+    """
+    行程內共用的封存，路徑可由 NEWS_ARCHIVE_DIR 設定；
+    設為空字串則停用（回傳 None）。
+    """
+    global _default_archive
+    root = os.environ.get("NEWS_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+    if not root:
+        return None
+    with _default_archive_lock:
+        if _default_archive is None or _default_archive.root != root:
+            _default_archive = NewsArchive(root)
+        return _default_archive
+
+
+def backfill(service, archive, start_date, end_date):
+    """逐日抓取並封存 start_date～end_date（含），已封存的日期略過。回傳 (封存數, 略過數, 失敗數)。"""
+    stored = skipped = failed = 0
+    day = start_date
+    while day <= end_date:
+        date_str = day.strftime("%Y/%m/%d")
+        if not is_archivable(date_str) or archive.has(date_str):
+            skipped += 1
+        else:
+            # fetch_news 對過去日期成功時會自動寫入封存
+            result = service.fetch_news(date_str)
+            if result["status"] == "success":
+                stored += 1
+            elif result["status"] == "no_news":
+                skipped += 1
+            else:
+                failed += 1
+                print(f"{date_str}: {result.get('message')}")
+        day += timedelta(days=1)
+    return stored, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="管理過去日期的本地新聞封存")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="一次性回填一段日期")
+    backfill_parser.add_argument("start", help="起始日期 YYYY/MM/DD")
+    backfill_parser.add_argument("end", help="結束日期 YYYY/MM/DD（含）")
+    subparsers.add_parser("compact", help="將評論 overlay 併入快照")
+    args = parser.parse_args(argv)
+
+    archive = get_default_archive()
+    if archive is None:
+        parser.error("NEWS_ARCHIVE_DIR 為空，封存已停用")
+
+    if args.command == "backfill":
+        from news_service import NewsService
+
+        start = datetime.strptime(args.start, "%Y/%m/%d").date()
+        end = datetime.strptime(args.end, "%Y/%m/%d").date()
+        stored, skipped, failed = backfill(NewsService(archive=archive), archive, start, end)
+        print(f"封存 {stored} 天，略過 {skipped} 天，失敗 {failed} 天")
+    elif args.command == "compact":
+        print(f"已合併 {archive.compact()} 個日期的評論")
+
+
+if __name__ == "__main__":
+    main()
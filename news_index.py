@@ -0,0 +1,84 @@
+import re
+
+# ====== 排序模式 ======
+SORT_DEFAULT = "default"
+SORT_SCORE = "score"
+
+SORT_LABELS = {
+    SORT_DEFAULT: "預設順序",
+    SORT_SCORE: "分數高→低",
+}
+
+ALL_TOPICS = ""
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_score(value):
+    """將「分數」欄位轉為數字（例如 8、"8.5"、"8/10"），無法解析時回傳 None。"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            return float(match.group())
+    return None
+
+
+def _orders_for(positions, scores):
+    """針對一組列位置產生所有排序模式的順序。"""
+    # 分數相同時保留 n8n 原始順序；無分數者排在最後
+    by_score = sorted(positions, key=lambda p: (scores[p] is None, -(scores[p] or 0.0)))
+    return {
+        SORT_DEFAULT: list(positions),
+        SORT_SCORE: by_score,
+    }
+
+
+def build_feed_index(rows):
+    """
+    為單日新聞建立索引（載入資料時計算一次，與快取資料一起保存）：
+    - orders: 各排序模式下的列位置順序
+    - topics: 各主題在各排序模式下的列位置順序
+    - topic_names: 依出現順序排列的主題名稱
+    """
+    scores = [parse_score(row.get("分數")) for row in rows]
+    positions_by_topic = {}
+    for position, row in enumerate(rows):
+        topic = str(row.get("主題") or "").strip()
+        if topic:
+            positions_by_topic.setdefault(topic, []).append(position)
+
+    return {
+        "orders": _orders_for(range(len(rows)), scores),
+        "topics": {topic: _orders_for(positions, scores) for topic, positions in positions_by_topic.items()},
+        "topic_names": list(positions_by_topic),
+    }
+
+
+def select_feed_order(index, rows, sort_mode=SORT_DEFAULT, topic=ALL_TOPICS,
+                      only_unread=False, only_uncommented=False, read_snos=None, keep_sno=None):
+    """
+    依排序模式與篩選條件回傳列位置清單。
+    排序與主題直接取自預先計算的索引；未讀／未評論篩選依目前狀態過濾一次。
+    keep_sno 指定的那則不受未讀篩選排除（正在瀏覽的一則已被標為已讀）。
+    """
+    if topic:
+        orders = index["topics"].get(topic)
+        if orders is None:
+            return []
+    else:
+        orders = index["orders"]
+    order = orders.get(sort_mode, orders[SORT_DEFAULT])
+
+    if only_unread:
+        read_snos = read_snos or set()
+        order = [
+            p for p in order
+            if rows[p].get("sno") not in read_snos or (keep_sno is not None and rows[p].get("sno") == keep_sno)
+        ]
+    if only_uncommented:
+        order = [p for p in order if not str(rows[p].get("評論") or "").strip()]
+    return list(order)
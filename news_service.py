@@ -1,16 +1,180 @@
-import requests
+import codecs
+import json
 import streamlit as st
 import traceback
 from datetime import datetime
 from utils import log_to_console
+from news_transport import load_endpoints, get_default_transport
+from news_archive import get_default_archive, is_archivable
+
+# 串流讀取時每次從回應取得的位元組數
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 分頁讀取的頁數上限，避免上游行為異常時無限請求
+MAX_PAGES = 1000
+
+_JSON_WHITESPACE = " \t\n\r"
+
+
+class UpstreamError(Exception):
+    """n8n 回傳非 200 狀態碼。"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"n8n 回應錯誤 ({status_code})")
+        self.status_code = status_code
+        self.text = text
+
+
+class JsonArrayError(ValueError):
+    """回應內容不是 JSON 陣列。"""
+
+
+def iter_json_array(chunks):
+    """
+    從位元組區塊串流中增量解碼頂層 JSON 陣列，逐一產生元素。
+    記憶體中只保留尚未解碼完成的部分；格式不正確（多餘的逗號、"]" 之後還有內容等）時拋出 ValueError。
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    # 解析狀態：start（等待 "["）、first（第一個元素或 "]"）、value（逗號後的元素）、
+    # separator（"," 或 "]"）、done（"]" 之後只允許空白）
+    state = "start"
+    eof = False
+    chunks = iter(chunks)
+
+    while not eof:
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buffer += utf8.decode(b"", final=True)
+        else:
+            buffer += utf8.decode(chunk)
+
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+            if state == "start":
+                if char != "[":
+                    raise JsonArrayError("n8n 回傳資料不是 JSON 陣列")
+                state = "first"
+                pos += 1
+            elif state == "separator":
+                if char == ",":
+                    state = "value"
+                elif char == "]":
+                    state = "done"
+                else:
+                    raise ValueError("n8n 回傳資料格式錯誤")
+                pos += 1
+            elif state == "done":
+                raise ValueError("n8n 回傳資料格式錯誤")
+            elif state == "first" and char == "]":
+                state = "done"
+                pos += 1
+            elif char in ",]":
+                raise ValueError("n8n 回傳資料格式錯誤")
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    break  # 元素尚未完整，等待下一個區塊
+                # 數字可能被區塊切斷（例如 "12" 後面還有 "3"），確認後面已出現其他字元才產生
+                after = end
+                while after < len(buffer) and buffer[after] in _JSON_WHITESPACE:
+                    after += 1
+                if not eof and (after >= len(buffer) or _may_continue_number(item, buffer[after])):
+                    break
+                yield item
+                state = "separator"
+                pos = end
+        buffer = buffer[pos:]
+
+    if state == "start":
+        raise JsonArrayError("n8n 回傳資料不是 JSON 陣列")
+    if state != "done":
+        raise ValueError("n8n 回傳資料不完整")
+
+
+def _may_continue_number(item, next_char):
+    return isinstance(item, (int, float)) and not isinstance(item, bool) and next_char in "0123456789.eE+-"
+
 
 class NewsService:
-    def __init__(self):
-        self.N8N_WEBHOOK_READ = "https://n8n.defintek.io/webhook/read_news"
-        self.N8N_WEBHOOK_UPDATE = "https://n8n.defintek.io/webhook/update_news"
+    def __init__(self, transport=None, read_endpoint=None, update_endpoint=None, archive=None):
+        # 端點設定來自環境變數（見 news_transport.EndpointConfig.from_env）
+        default_read, default_update = load_endpoints()
+        self.read_endpoint = read_endpoint or default_read
+        self.update_endpoint = update_endpoint or default_update
+        self.transport = transport or get_default_transport()
+        # 過去日期的本地封存；傳入 False 可停用
+        self.archive = get_default_archive() if archive is None else (archive or None)
+        self.N8N_WEBHOOK_READ = self.read_endpoint.url
+        self.N8N_WEBHOOK_UPDATE = self.update_endpoint.url
+
+    def _iter_rows(self, date_str):
+        """
+        fetch_news 使用的讀取迴圈，逐列產生已正規化的新聞。
+        回應內容以串流方式增量解碼並逐列正規化，因此不會同時持有原始回應文字、
+        原始陣列與正規化後的列表；fetch_news 仍會收集完整列表後才回傳，畫面不會提前顯示。
+        若讀取端點設定了 page_size，則以 offset/limit 分頁請求，直到：
+        - 回傳列數少於 page_size（最後一頁）
+        - 回傳列數多於 page_size，或第二頁起與第一頁開頭相同（伺服器不支援分頁，已取得完整資料）
+        - 回傳 n8n 的 [{"message": ...}] 訊息（不視為資料列）
+        - 已達 MAX_PAGES 頁
+        """
+        page_size = self.read_endpoint.page_size
+        offset = 0
+        first_row = None
+        for page in range(MAX_PAGES if page_size else 1):
+            params = {"date": date_str}
+            if page_size:
+                params["offset"] = offset
+                params["limit"] = page_size
+            response = self.transport.request("GET", self.read_endpoint, params=params, stream=True)
+            count = 0
+            held = None  # 頁面第一列若像訊息，先保留到確認不是唯一一列
+            try:
+                if response.status_code != 200:
+                    raise UpstreamError(response.status_code, response.text)
+                for item in iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)):
+                    row = item.get("json", item) if isinstance(item, dict) else item
+                    count += 1
+                    if count == 1:
+                        if page > 0 and row == first_row:
+                            return  # 伺服器忽略 offset，重複回傳第一頁
+                        if page == 0:
+                            first_row = row
+                        if isinstance(row, dict) and "message" in row:
+                            held = row
+                            continue
+                    if held is not None:
+                        yield held
+                        held = None
+                    if page > 0 and count > page_size:
+                        return  # 伺服器忽略 limit，其餘列與前幾頁重複
+                    yield row
+            finally:
+                response.close()
+            if held is not None and count == 1:
+                return  # 只有訊息（例如 "RAW 資料為空..."），沒有資料列
+            if not page_size or count != page_size:
+                # 少於 page_size 為最後一頁；多於 page_size 表示第一頁已是完整資料
+                return
+            offset += count
+        log_to_console(f"⚠️ _iter_rows stopped after {MAX_PAGES} pages for date: {date_str}")
 
-    def fetch_news(self, date_str):
-        """獲取特定日期的新聞。"""
+    def fetch_news(self, date_str, refresh=False):
+        """
+        獲取特定日期的新聞。
+        refresh=True 時略過本地封存，一律向 n8n 取得並重寫該日期的快照。
+        """
         try:
             # 記錄獲取嘗試與時間戳記（使用 log_to_console 讓 F12 可見）
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -19,46 +183,42 @@ class NewsService:
             except:
                 pass  # 若 log_to_console 失敗則靜默處理
             
-            response = requests.get(self.N8N_WEBHOOK_READ, params={"date": date_str})
-            if response.status_code == 200:
-                data = response.json()
-                
-                if isinstance(data, list):
-                    if not data:
-                        # 空列表 - 檢查日期以決定訊息
-                        selected_date = datetime.strptime(date_str, "%Y/%m/%d").date()
-                        today = datetime.today().date()
-                        
-                        if selected_date > today:
-                            # 未來日期 - 無此表單
-                            return {"status": "future_date", "message": "📅 無此日期資料請重選日期", "data": []}
-                        else:
-                            # 過去/今天 - 無新聞資料
-                            return {"status": "no_news", "message": "📭 本日無新聞資料", "data": []}
-                    elif len(data) == 1 and "message" in data[0]:
-                        # 回應包含訊息（例如 "RAW 資料為空..."）
-                        # 使用日期決定適當的回應
-                        selected_date = datetime.strptime(date_str, "%Y/%m/%d").date()
-                        today = datetime.today().date()
-                        
-                        if selected_date > today:
-                            # 未來日期 - 無此表單
-                            return {"status": "future_date", "message": "📅 無此日期資料請重選日期", "data": []}
-                        else:
-                            # 過去/今天 - 無新聞資料
-                            return {"status": "no_news", "message": "📭 本日無新聞資料", "data": []}
-                    else:
-                        # 實際新聞資料
-                        normalized_data = [item.get("json", item) for item in data]
-                        return {"status": "success", "data": normalized_data}
-                else:
-                    return {"status": "error", "message": "n8n 回傳資料格式錯誤"}
-            else:
+            # 已結束的日期優先從本地封存讀取，不呼叫 n8n
+            if self.archive and is_archivable(date_str) and not refresh:
+                archived = self.archive.load(date_str)
+                if archived:
+                    return {"status": "success", "data": archived}
+
+            try:
+                normalized_data = list(self._iter_rows(date_str))
+            except JsonArrayError:
+                return {"status": "error", "message": "n8n 回傳資料格式錯誤"}
+            except UpstreamError as e:
                 # 檢查錯誤回應是否表示表單未找到
-                error_text = response.text.lower()
-                if "not found" in error_text or "404" in error_text or "找不到" in response.text or "不存在" in response.text:
+                error_text = e.text.lower()
+                if "not found" in error_text or "404" in error_text or "找不到" in e.text or "不存在" in e.text:
                     return {"status": "error", "message": "📅 無此日期資料請重選日期"}
-                return {"status": "error", "message": f"n8n 回應錯誤: {response.text}"}
+                return {"status": "error", "message": f"n8n 回應錯誤: {e.text}"}
+
+            # 空列表，或回應只包含訊息（例如 "RAW 資料為空..."，_iter_rows 不會產生該列） - 檢查日期以決定訊息
+            if not normalized_data:
+                selected_date = datetime.strptime(date_str, "%Y/%m/%d").date()
+                today = datetime.today().date()
+                
+                if selected_date > today:
+                    # 未來日期 - 無此表單
+                    return {"status": "future_date", "message": "📅 無此日期資料請重選日期", "data": []}
+                else:
+                    # 過去/今天 - 無新聞資料
+                    return {"status": "no_news", "message": "📭 本日無新聞資料", "data": []}
+
+            # 實際新聞資料
+            if self.archive and is_archivable(date_str):
+                try:
+                    self.archive.store(date_str, normalized_data, reset_comments=True)
+                except OSError as e:
+                    log_to_console(f"⚠️ archive store failed for {date_str}: {e}")
+            return {"status": "success", "data": normalized_data}
         except Exception as e:
             error_msg = str(e).lower()
             if "not found" in error_msg or "404" in error_msg:
@@ -73,8 +233,14 @@ class NewsService:
                 "rowIndex": row_index,
                 "comment": comment
             }
-            response = requests.post(self.N8N_WEBHOOK_UPDATE, json=payload)
+            response = self.transport.request("POST", self.update_endpoint, json=payload)
             if response.status_code == 200:
+                # 已封存的日期將評論記入 overlay，讓之後的讀取保持一致
+                if self.archive and self.archive.has(sheet_name):
+                    try:
+                        self.archive.record_comment(sheet_name, row_index, comment)
+                    except OSError as e:
+                        log_to_console(f"⚠️ archive comment failed for {sheet_name}: {e}")
                 return {"status": "success", "message": "評論已送出！"}
             else:
                 # 避免顯示過長的 HTML 錯誤訊息
@@ -0,0 +1,279 @@
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ====== 預設端點 ======
+DEFAULT_READ_URL = "https://n8n.defintek.io/webhook/read_news"
+DEFAULT_UPDATE_URL = "https://n8n.defintek.io/webhook/update_news"
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_POOL_SIZE = 10
+DEFAULT_PAGE_SIZE = 0  # 0 表示不分頁
+
+
+class EndpointConfig:
+    """單一 Webhook 端點的設定（網址、逾時秒數、連線池大小、分頁大小）。"""
+
+    def __init__(self, name, url, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, page_size=DEFAULT_PAGE_SIZE):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.page_size = page_size
+
+    @classmethod
+    def from_env(cls, name, default_url):
+        """
+        從環境變數讀取端點設定，例如 name="read" 時讀取：
+        N8N_READ_URL、N8N_READ_TIMEOUT、N8N_READ_POOL_SIZE、N8N_READ_PAGE_SIZE。
+        """
+        prefix = f"N8N_{name.upper()}"
+        url = os.environ.get(f"{prefix}_URL", default_url)
+        timeout = float(os.environ.get(f"{prefix}_TIMEOUT", DEFAULT_TIMEOUT))
+        pool_size = int(os.environ.get(f"{prefix}_POOL_SIZE", DEFAULT_POOL_SIZE))
+        page_size = int(os.environ.get(f"{prefix}_PAGE_SIZE", DEFAULT_PAGE_SIZE))
+        return cls(name, url, timeout=timeout, pool_size=pool_size, page_size=page_size)
+
+    def __repr__(self):
+        return (
+            f"EndpointConfig({self.name!r}, {self.url!r}, timeout={self.timeout}, "
+            f"pool_size={self.pool_size}, page_size={self.page_size})"
+        )
+
+
+def load_endpoints():
+    """回傳 (read, update) 兩個端點設定。"""
+    return (
+        EndpointConfig.from_env("read", DEFAULT_READ_URL),
+        EndpointConfig.from_env("update", DEFAULT_UPDATE_URL),
+    )
+
+
+class TransportResponse:
+    """非 HTTP 傳輸層使用的回應物件，提供與 requests.Response 相同的常用介面。"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=8192):
+        data = self.text.encode("utf-8")
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+def _request_key(method, endpoint_name, params=None, payload=None):
+    """產生可比對的請求鍵值（用於錄製檔重播）。"""
+    return json.dumps(
+        [method.upper(), endpoint_name, params or {}, payload or {}],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+
+
+class Transport:
+    """
+    傳輸層介面。NewsService 只透過 request() 與上游溝通，
+    回傳值需具備 status_code、text、json() 與 iter_content()。
+    """
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        raise NotImplementedError
+
+
+class HttpTransport(Transport):
+    """透過 requests 連線至 n8n，每個端點各自維護一個連線池。"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session_for(self, endpoint):
+        with self._lock:
+            session = self._sessions.get(endpoint.name)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=endpoint.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[endpoint.name] = session
+            return session
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        session = self._session_for(endpoint)
+        return session.request(
+            method,
+            endpoint.url,
+            params=params,
+            json=json,
+            timeout=endpoint.timeout,
+            stream=stream,
+        )
+
+
+class InMemoryTransport(Transport):
+    """
+    記憶體內的假 n8n：sheets 為 {"YYYY/MM/DD": [row, ...]}。
+    讀取端點依 date 參數回傳列資料（有 offset/limit 時分頁），更新端點依 rowIndex 寫入評論。
+    所有呼叫都記錄在 calls 中，方便測試與計算上游呼叫次數。
+    """
+
+    def __init__(self, sheets=None):
+        self.sheets = sheets if sheets is not None else {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        with self._lock:
+            self.calls.append((method.upper(), endpoint.name, params, json))
+            if endpoint.name == "read":
+                params = params or {}
+                rows = self.sheets.get(params.get("date"), [])
+                if "limit" in params:
+                    offset = int(params.get("offset", 0))
+                    rows = rows[offset:offset + int(params["limit"])]
+                return TransportResponse(200, _dumps(rows))
+            if endpoint.name == "update":
+                payload = json or {}
+                rows = self.sheets.get(payload.get("sheetName"))
+                if rows is None:
+                    return TransportResponse(404, "sheet not found")
+                for item in rows:
+                    row = item.get("json", item)
+                    if row.get("列號") == payload.get("rowIndex"):
+                        row["評論"] = payload.get("comment", "")
+                        return TransportResponse(200, _dumps({"status": "ok"}))
+                return TransportResponse(404, "row not found")
+            return TransportResponse(404, f"unknown endpoint: {endpoint.name}")
+
+
+class ReplayTransport(Transport):
+    """
+    從錄製檔（JSON Lines）重播回應，完全離線。
+    每行格式：{"method", "endpoint", "params", "json", "status_code", "body", "elapsed"}。
+    同一請求錄製多次時依序回放，用完後重複最後一筆。
+    speedup > 0 時依錄製的 elapsed / speedup 模擬上游延遲；0 表示不延遲。
+    sleep 可替換為虛擬時鐘（例如 replay_benchmark.py 只累計延遲而不實際等待）。
+    """
+
+    def __init__(self, fixture_path, speedup=0, sleep=time.sleep):
+        self.fixture_path = fixture_path
+        self.speedup = speedup
+        self.sleep = sleep
+        self.records = load_fixture(fixture_path)
+        self.calls = []
+        self._responses = {}
+        self._cursor = {}
+        self._lock = threading.Lock()
+        for record in self.records:
+            key = _request_key(record["method"], record["endpoint"], record.get("params"), record.get("json"))
+            self._responses.setdefault(key, []).append(record)
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        key = _request_key(method, endpoint.name, params, json)
+        with self._lock:
+            self.calls.append((method.upper(), endpoint.name, params, json))
+            recorded = self._responses.get(key)
+            if not recorded:
+                raise LookupError(f"錄製檔中找不到對應請求: {method} {endpoint.name} {params or json}")
+            position = self._cursor.get(key, 0)
+            self._cursor[key] = min(position + 1, len(recorded) - 1)
+            record = recorded[position]
+        if self.speedup and record.get("elapsed"):
+            self.sleep(record["elapsed"] / self.speedup)
+        return TransportResponse(record["status_code"], record["body"])
+
+
+class RecordingTransport(Transport):
+    """
+    包裝另一個傳輸層，將每次請求與回應（含耗時）附加寫入錄製檔，
+    產生的檔案可直接交給 ReplayTransport 重播。
+    錄製時會先讀完整個回應內容，因此不會串流。
+    """
+
+    def __init__(self, inner, fixture_path):
+        self.inner = inner
+        self.fixture_path = fixture_path
+        self._lock = threading.Lock()
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        started = time.perf_counter()
+        response = self.inner.request(method, endpoint, params=params, json=json)
+        body = response.text
+        elapsed = time.perf_counter() - started
+        record = {
+            "method": method.upper(),
+            "endpoint": endpoint.name,
+            "params": params,
+            "json": json,
+            "status_code": response.status_code,
+            "body": body,
+            "elapsed": round(elapsed, 6),
+            "recorded_at": time.time(),
+        }
+        with self._lock:
+            with open(self.fixture_path, "a", encoding="utf-8") as f:
+                f.write(_dumps(record) + "\n")
+        return TransportResponse(response.status_code, body)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def load_fixture(path):
+    """讀取 JSON Lines 錄製檔。"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def create_transport_from_env():
+    """
+    依環境變數 NEWS_TRANSPORT 建立傳輸層：
+    http（預設）、memory、replay（需搭配 NEWS_REPLAY_FIXTURE，可用 NEWS_REPLAY_SPEEDUP 模擬延遲）。
+    設定 NEWS_RECORD_FIXTURE 時，會將所有請求與回應錄製到該檔案。
+    """
+    kind = os.environ.get("NEWS_TRANSPORT", "http").lower()
+    if kind == "memory":
+        transport = InMemoryTransport()
+    elif kind == "replay":
+        fixture_path = os.environ.get("NEWS_REPLAY_FIXTURE")
+        if not fixture_path:
+            raise ValueError("NEWS_TRANSPORT=replay 需要設定 NEWS_REPLAY_FIXTURE")
+        transport = ReplayTransport(fixture_path, speedup=float(os.environ.get("NEWS_REPLAY_SPEEDUP", 0)))
+    elif kind == "http":
+        transport = HttpTransport()
+    else:
+        raise ValueError(f"未知的 NEWS_TRANSPORT: {kind}")
+
+    record_path = os.environ.get("NEWS_RECORD_FIXTURE")
+    if record_path:
+        transport = RecordingTransport(transport, record_path)
+    return transport
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """行程內共用的傳輸層，讓每次建立 NewsService 時都能重複使用連線池。"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = create_transport_from_env()
+        return _default_transport
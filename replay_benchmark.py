@@ -0,0 +1,312 @@
+"""
+離線重播基準測試：以錄製的上游流量（NEWS_RECORD_FIXTURE 產生的 JSON Lines）
+對 NewsService 模擬多個工作階段，流程與 App 相同：
+handle_update（經由共用快取讀取）→ 上／下一則導航 → handle_comment。
+
+模擬在虛擬時鐘上以單一執行緒進行，結果可重現：
+- 工作階段的到達時間取自錄製檔中各次讀取的 recorded_at 間隔，再除以 speedup
+  （speedup 越大，同樣的流量越密集；0 表示全部同時到達）；工作階段數超過錄製的讀取次數時循環使用。
+- 上游延遲為錄製的 elapsed，只推進虛擬時鐘，不實際等待。
+- 實際量測的 CPU 時間另行回報，不影響事件順序，因此快取命中／未命中與上游呼叫次數只取決於錄製檔與種子。
+
+錄製：
+    NEWS_RECORD_FIXTURE=traffic.jsonl streamlit run NewsCommentApp.py
+重播：
+    python replay_benchmark.py traffic.jsonl --sessions 500 --speedup 10
+
+報告模擬時間內的吞吐量、各操作的尾端延遲、同時進行的工作階段峰值、上游呼叫放大倍數與記憶體用量。
+"""
+import argparse
+import heapq
+import json
+import math
+import pickle
+import random
+import time
+import tracemalloc
+
+from news_index import build_feed_index, select_feed_order, SORT_LABELS
+from news_archive import NewsArchive
+from news_service import NewsService
+from news_transport import ReplayTransport
+
+DEFAULT_ARRIVAL_GAP = 1.0  # 錄製檔缺少 recorded_at 時，相鄰讀取的間隔（秒）
+THINK_SECONDS = (0.5, 3.0)  # 使用者每次操作之間的停頓範圍（秒）
+
+
+class UpstreamClock:
+    """取代 ReplayTransport 的 time.sleep：只累計上游延遲，不實際等待。"""
+
+    def __init__(self):
+        self.total = 0.0
+
+    def sleep(self, seconds):
+        self.total += seconds
+
+
+class SharedNewsCache:
+    """
+    模擬 App 中 get_cached_news（st.cache_data）的行為：
+    依日期快取 fetch_news 結果與索引，每次命中時回傳反序列化的副本。
+    未命中的結果要到上游延遲結束後才可被命中；在此之前到達的工作階段同樣未命中
+    （st.cache_data 不合併同時發生的未命中）。
+    """
+
+    def __init__(self, service, clock, enabled=True):
+        self.service = service
+        self.clock = clock
+        self.enabled = enabled
+        self._entries = {}
+
+    def get(self, date_str, now):
+        """回傳 (結果, 上游延遲秒數)。"""
+        if self.enabled:
+            entry = self._entries.get(date_str)
+            if entry is not None and entry[0] <= now:
+                return pickle.loads(entry[1]), 0.0
+
+        before = self.clock.total
+        result = self.service.fetch_news(date_str)
+        upstream = self.clock.total - before
+        if result["status"] == "success" and "data" in result:
+            result["feed_index"] = build_feed_index(result["data"])
+        if self.enabled:
+            ready_at = now + upstream
+            entry = self._entries.get(date_str)
+            if entry is None or ready_at < entry[0]:
+                self._entries[date_str] = (ready_at, pickle.dumps(result))
+        return result, upstream
+
+
+def _is_first_page(record):
+    offset = (record.get("params") or {}).get("offset")
+    return offset is None or int(offset) == 0
+
+
+def build_plan(records):
+    """
+    從錄製檔整理出重播計畫：
+    arrivals 為 [(相對到達秒數, 日期)]，依每次 handle_update（讀取第一頁）的 recorded_at 計算；
+    comments 為 {日期: [評論請求]}。
+    """
+    arrivals = []
+    comments = {}
+    offset = 0.0
+    previous = None
+    for record in records:
+        if record["method"] == "GET" and record["endpoint"] == "read" and _is_first_page(record):
+            date_str = (record.get("params") or {}).get("date")
+            if not date_str:
+                continue
+            recorded_at = record.get("recorded_at")
+            if arrivals:
+                if recorded_at is not None and previous is not None and recorded_at >= previous:
+                    offset += recorded_at - previous
+                else:
+                    offset += DEFAULT_ARRIVAL_GAP
+            previous = recorded_at
+            arrivals.append((offset, date_str))
+        elif record["method"] == "POST" and record["endpoint"] == "update":
+            payload = record.get("json") or {}
+            comments.setdefault(payload.get("sheetName"), []).append(payload)
+    return arrivals, comments
+
+
+def arrival_time(arrivals, session_id, speedup):
+    """第 session_id 個工作階段的虛擬到達時間；超過錄製的讀取次數時，接在前一輪之後循環。"""
+    if not speedup:
+        return 0.0
+    rounds, i = divmod(session_id, len(arrivals))
+    span = arrivals[-1][0]
+    period = span + (span / (len(arrivals) - 1) if len(arrivals) > 1 else DEFAULT_ARRIVAL_GAP)
+    return (rounds * period + arrivals[i][0]) / speedup
+
+
+def run_session(session_id, seed, date_str, comments, service, cache, max_steps, timings):
+    """
+    單一工作階段（產生器）：每次 yield 需等待的虛擬秒數，事件迴圈再送回目前的虛擬時間。
+    每個操作記錄 (操作, 虛擬延遲秒數, CPU 秒數) 到 timings。
+    """
+    rng = random.Random(seed * 1000003 + session_id)
+    now = yield 0.0
+
+    # handle_update
+    started = time.perf_counter()
+    result, upstream = cache.get(date_str, now)
+    timings.append(("update", upstream, time.perf_counter() - started))
+    now = yield upstream
+    if result["status"] != "success":
+        return
+
+    # 導航
+    now = yield rng.uniform(*THINK_SECONDS)
+    rows = result["data"]
+    started = time.perf_counter()
+    order = select_feed_order(result["feed_index"], rows, sort_mode=rng.choice(list(SORT_LABELS)))
+    cursor = 0
+    steps = rng.randint(0, max_steps)
+    for _ in range(steps):
+        if order:
+            cursor = min(cursor + 1, len(order) - 1)
+            rows[order[cursor]].get("標題")
+    timings.append(("navigate", 0.0, time.perf_counter() - started))
+
+    # handle_comment（使用錄製過的評論請求，確保能在重播檔中找到）
+    payloads = comments.get(date_str)
+    if payloads:
+        payload = rng.choice(payloads)
+        now = yield steps * rng.uniform(*THINK_SECONDS)
+        before = cache.clock.total
+        started = time.perf_counter()
+        service.post_comment(payload["sheetName"], payload["rowIndex"], payload["comment"])
+        cpu = time.perf_counter() - started
+        upstream = cache.clock.total - before
+        timings.append(("comment", upstream, cpu))
+        yield upstream
+
+
+def percentile(sorted_values, pct):
+    """最近排名法百分位數。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def run_benchmark(fixture_path, sessions=100, speedup=1.0, max_steps=10, seed=0,
+                  use_cache=True, trace_memory=True, archive_dir=None):
+    clock = UpstreamClock()
+    # speedup 只壓縮到達時間；上游延遲維持錄製值
+    transport = ReplayTransport(fixture_path, speedup=1, sleep=clock.sleep)
+    arrivals, comments = build_plan(transport.records)
+    if not arrivals:
+        raise ValueError("錄製檔中沒有 read 請求，無法重播")
+
+    archive = NewsArchive(archive_dir) if archive_dir else False
+    service = NewsService(transport=transport, archive=archive)
+    cache = SharedNewsCache(service, clock, enabled=use_cache)
+
+    # 事件佇列：(虛擬時間, 工作階段編號, 產生器)；同時間依編號處理，順序固定
+    queue = []
+    session_timings = []
+    for i in range(sessions):
+        timings = []
+        session_timings.append(timings)
+        session = run_session(i, seed, arrivals[i % len(arrivals)][1], comments, service, cache, max_steps, timings)
+        next(session)
+        heapq.heappush(queue, (arrival_time(arrivals, i, speedup), i, session))
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    arrived = set()
+    in_flight = max_in_flight = 0
+    finished_at = 0.0
+    while queue:
+        now, i, session = heapq.heappop(queue)
+        if i not in arrived:
+            arrived.add(i)
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        try:
+            delay = session.send(now)
+        except StopIteration:
+            in_flight -= 1
+            finished_at = max(finished_at, now)
+            continue
+        heapq.heappush(queue, (now + delay, i, session))
+    cpu_seconds = time.perf_counter() - started
+    memory_peak = None
+    if trace_memory:
+        _, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latency_by_op = {}
+    cpu_by_op = {}
+    for timings in session_timings:
+        for op, latency, cpu in timings:
+            latency_by_op.setdefault(op, []).append(latency)
+            cpu_by_op.setdefault(op, []).append(cpu)
+
+    logical_calls = len(latency_by_op.get("update", [])) + len(latency_by_op.get("comment", []))
+    upstream_calls = len(transport.calls)
+    report = {
+        "sessions": sessions,
+        "speedup": speedup,
+        "cache": use_cache,
+        "simulated_seconds": round(finished_at, 4),
+        "sessions_per_second": round(sessions / finished_at, 2) if finished_at else None,
+        "max_in_flight": max_in_flight,
+        "cpu_seconds": round(cpu_seconds, 4),
+        "operations": {},
+        "upstream_calls": upstream_calls,
+        "upstream_reads": sum(1 for call in transport.calls if call[1] == "read"),
+        "upstream_updates": sum(1 for call in transport.calls if call[1] == "update"),
+        "amplification": round(upstream_calls / logical_calls, 4) if logical_calls else None,
+        "memory_peak_mb": round(memory_peak / (1024 * 1024), 2) if memory_peak is not None else None,
+    }
+    for op, values in latency_by_op.items():
+        values.sort()
+        cpu_values = sorted(cpu_by_op[op])
+        report["operations"][op] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+            "cpu_p50_ms": round(percentile(cpu_values, 50) * 1000, 3),
+            "cpu_p99_ms": round(percentile(cpu_values, 99) * 1000, 3),
+        }
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"工作階段: {report['sessions']}（加速 {report['speedup'] or '全部同時到達'}，快取 {'開' if report['cache'] else '關'}）",
+        f"模擬時間: {report['simulated_seconds']} s，吞吐量: {report['sessions_per_second']} sessions/s，"
+        f"同時進行峰值: {report['max_in_flight']}，實際 CPU: {report['cpu_seconds']} s",
+    ]
+    for op, stats in report["operations"].items():
+        lines.append(
+            f"  {op:<9} n={stats['count']:<6} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+            f"p99={stats['p99_ms']}ms max={stats['max_ms']}ms "
+            f"(CPU p50={stats['cpu_p50_ms']}ms p99={stats['cpu_p99_ms']}ms)"
+        )
+    lines.append(
+        f"上游呼叫: {report['upstream_calls']}（read {report['upstream_reads']}，update {report['upstream_updates']}），"
+        f"放大倍數: {report['amplification']}"
+    )
+    if report["memory_peak_mb"] is not None:
+        lines.append(f"記憶體峰值: {report['memory_peak_mb']} MB")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以錄製流量離線重播並量測 NewsService")
+    parser.add_argument("fixture", help="NEWS_RECORD_FIXTURE 產生的 JSON Lines 錄製檔")
+    parser.add_argument("--sessions", type=int, default=100, help="模擬的工作階段數")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="到達間隔 = 錄製的 recorded_at 間隔 / speedup，0 表示全部同時到達")
+    parser.add_argument("--steps", type=int, default=10, help="每個工作階段最多導航幾則")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子（決定每個工作階段的流程）")
+    parser.add_argument("--no-cache", action="store_true", help="停用共用快取（每次更新都呼叫上游）")
+    parser.add_argument("--no-memory", action="store_true", help="不追蹤記憶體（tracemalloc 會降低吞吐量）")
+    parser.add_argument("--archive", default=None, help="使用指定目錄的本地封存（預設停用）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出報告")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        args.fixture,
+        sessions=args.sessions,
+        speedup=args.speedup,
+        max_steps=args.steps,
+        seed=args.seed,
+        use_cache=not args.no_cache,
+        trace_memory=not args.no_memory,
+        archive_dir=args.archive,
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 專案為扁平模組結構，測試時直接從專案根目錄匯入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 測試不應寫入預設的本地封存
+os.environ.setdefault("NEWS_ARCHIVE_DIR", "")
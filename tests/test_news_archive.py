@@ -0,0 +1,41 @@
+import os
+
+from news_archive import COMMENT_LOG, COMPACTING_LOG, NewsArchive
+
+DATE = "2026/01/05"
+
+
+def make_rows(comment=""):
+    return [{"sno": i, "列號": i + 2, "標題": f"t{i}", "評論": comment} for i in range(3)]
+
+
+def test_compact_folds_comments_into_snapshot(tmp_path):
+    archive = NewsArchive(str(tmp_path))
+    archive.store(DATE, make_rows())
+    archive.record_comment(DATE, 3, "好")
+    assert archive.compact() == 1
+    assert not os.path.exists(tmp_path / COMMENT_LOG)
+    assert archive._read_snapshot(DATE)[1]["評論"] == "好"
+    assert archive.load(DATE)[1]["評論"] == "好"
+
+
+def test_compact_skips_date_refreshed_during_compaction(tmp_path):
+    archive = NewsArchive(str(tmp_path))
+    archive.store(DATE, make_rows())
+    archive.record_comment(DATE, 3, "舊評論")
+
+    # 模擬 compact() 已將日誌改名後，App 重新從 n8n 取得同一日期
+    pending = str(tmp_path / COMPACTING_LOG)
+    os.replace(tmp_path / COMMENT_LOG, pending)
+    fresh = make_rows("n8n 最新")
+    archive.store(DATE, fresh, reset_comments=True)
+
+    assert archive._fold_log(pending) == 0
+    assert archive.load(DATE) == fresh
+
+
+def test_store_leaves_no_temp_files(tmp_path):
+    archive = NewsArchive(str(tmp_path))
+    archive.store(DATE, make_rows())
+    archive.store(DATE, make_rows("x"))
+    assert os.listdir(os.path.dirname(archive.snapshot_path(DATE))) == ["05.snap"]
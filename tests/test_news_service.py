@@ -0,0 +1,161 @@
+import json
+import random
+
+import pytest
+
+from news_service import NewsService, iter_json_array, JsonArrayError
+from news_transport import EndpointConfig, InMemoryTransport, Transport, TransportResponse
+
+DATE = "2026/01/05"
+
+
+def random_chunks(data, rng):
+    """把位元組切成隨機大小的區塊（1～17 bytes）。"""
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, 17)
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+# ====== iter_json_array ======
+
+SAMPLE = [
+    {"json": {"sno": 1, "標題": "中文標題，含逗號與 ] 符號", "分數": 8.5}},
+    {"sno": 2, "評論": None, "tags": [1, [2, 3]], "nested": {"a": {"b": "}"}}},
+    123456789,
+    -0.25e-2,
+    1.5e10,
+    "x,]",
+    True,
+    False,
+    None,
+    [],
+    {},
+]
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_json_array_random_chunks(indent):
+    data = json.dumps(SAMPLE, ensure_ascii=False, indent=indent).encode("utf-8")
+    rng = random.Random(indent or 0)
+    for _ in range(200):
+        assert list(iter_json_array(random_chunks(data, rng))) == SAMPLE
+
+
+@pytest.mark.parametrize("data", [b"[]", b"  [ ]  \n", b"[1]", b"[ 1 , 2 ]"])
+def test_iter_json_array_valid(data):
+    assert list(iter_json_array([data])) == json.loads(data)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"[1,,2]", b"[,1]", b"[1,]", b"[1 2]", b"[1]garbage", b"[1] [2]", b"[1", b"[2.]", b'["a"'],
+)
+def test_iter_json_array_rejects_invalid(data):
+    for chunk_size in (1, 2, len(data)):
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        with pytest.raises(ValueError):
+            list(iter_json_array(chunks))
+
+
+@pytest.mark.parametrize("data", [b'{"a": 1}', b"", b"  "])
+def test_iter_json_array_not_array(data):
+    with pytest.raises(JsonArrayError):
+        list(iter_json_array([data]))
+
+
+# ====== 分頁 ======
+
+class IgnoresPagingTransport(Transport):
+    """忽略 offset/limit，每次都回傳完整陣列的 webhook。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        self.calls += 1
+        return TransportResponse(200, _dumps(self.rows))
+
+
+class PagedTransport(Transport):
+    """支援分頁，但指定頁面改回傳 n8n 的訊息列。"""
+
+    def __init__(self, rows, message_at_offset=None):
+        self.rows = rows
+        self.message_at_offset = message_at_offset
+        self.calls = 0
+
+    def request(self, method, endpoint, params=None, json=None, stream=False):
+        self.calls += 1
+        offset, limit = params["offset"], params["limit"]
+        if offset == self.message_at_offset:
+            return TransportResponse(200, _dumps([{"message": "RAW 資料為空"}]))
+        return TransportResponse(200, _dumps(self.rows[offset:offset + limit]))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def make_service(transport, page_size):
+    return NewsService(
+        transport=transport,
+        read_endpoint=EndpointConfig("read", "http://stub/read", page_size=page_size),
+        archive=False,
+    )
+
+
+@pytest.mark.parametrize("total", [1, 2, 3, 5])
+def test_paging_stops_when_webhook_ignores_offset_and_limit(total):
+    rows = [{"sno": i} for i in range(total)]
+    transport = IgnoresPagingTransport(rows)
+    result = make_service(transport, page_size=2).fetch_news(DATE)
+    assert result["status"] == "success"
+    assert result["data"] == rows
+    # 多於 page_size 時第一頁即停止；剛好等於 page_size 時第二頁重複第一頁而停止
+    assert transport.calls <= 2
+
+
+@pytest.mark.parametrize("page_size", [0, 1, 2, 3, 7, 10])
+def test_paging_reads_all_pages(page_size):
+    rows = [{"json": {"sno": i}} for i in range(7)]
+    transport = InMemoryTransport({DATE: rows})
+    result = make_service(transport, page_size).fetch_news(DATE)
+    assert [row["sno"] for row in result["data"]] == list(range(7))
+
+
+def test_paging_stops_at_message_sentinel():
+    transport = PagedTransport([{"sno": 0}, {"sno": 1}], message_at_offset=2)
+    result = make_service(transport, page_size=2).fetch_news(DATE)
+    assert result["data"] == [{"sno": 0}, {"sno": 1}]
+    assert transport.calls == 2
+
+
+def test_message_sentinel_is_not_a_row():
+    transport = IgnoresPagingTransport([{"message": "RAW 資料為空"}])
+    result = make_service(transport, page_size=0).fetch_news(DATE)
+    assert result["status"] == "no_news"
+    assert result["data"] == []
+
+
+def test_paging_respects_max_pages(monkeypatch):
+    import news_service
+
+    class EndlessTransport(Transport):
+        def __init__(self):
+            self.calls = 0
+
+        def request(self, method, endpoint, params=None, json=None, stream=False):
+            self.calls += 1
+            offset = params["offset"]
+            return TransportResponse(200, _dumps([{"sno": offset}, {"sno": offset + 1}]))
+
+    monkeypatch.setattr(news_service, "MAX_PAGES", 3)
+    transport = EndlessTransport()
+    result = make_service(transport, page_size=2).fetch_news(DATE)
+    assert transport.calls == 3
+    assert len(result["data"]) == 6
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from replay_benchmark import run_benchmark
+
+DATES = ["2026/01/05", "2026/01/06"]
+
+
+@pytest.fixture
+def fixture_path(tmp_path):
+    """每次讀取相隔 2 秒、上游耗時 1 秒的錄製檔。"""
+    records = []
+    for k in range(6):
+        date_str = DATES[k % 2]
+        rows = [{"sno": i, "列號": i + 2, "標題": f"t{i}", "分數": i, "評論": ""} for i in range(5)]
+        records.append({
+            "method": "GET", "endpoint": "read", "params": {"date": date_str}, "json": None,
+            "status_code": 200, "body": json.dumps(rows, ensure_ascii=False),
+            "elapsed": 1.0, "recorded_at": 1000.0 + 2 * k,
+        })
+    for date_str in DATES:
+        records.append({
+            "method": "POST", "endpoint": "update", "params": None,
+            "json": {"sheetName": date_str, "rowIndex": 2, "comment": "ok"},
+            "status_code": 200, "body": "{}", "elapsed": 0.5, "recorded_at": 1020.0,
+        })
+    path = tmp_path / "traffic.jsonl"
+    path.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records), encoding="utf-8")
+    return str(path)
+
+
+def _simulated(report):
+    """去除實際量測（CPU）的欄位，只留下由虛擬時鐘決定的結果。"""
+    result = {k: v for k, v in report.items() if k not in ("cpu_seconds", "memory_peak_mb", "operations")}
+    result["operations"] = {
+        op: {k: v for k, v in stats.items() if not k.startswith("cpu")}
+        for op, stats in report["operations"].items()
+    }
+    return result
+
+
+@pytest.mark.parametrize("speedup", [0, 1, 4])
+def test_benchmark_is_deterministic(fixture_path, speedup):
+    reports = [
+        _simulated(run_benchmark(fixture_path, sessions=40, speedup=speedup, seed=3, trace_memory=False))
+        for _ in range(3)
+    ]
+    assert reports[0] == reports[1] == reports[2]
+
+
+def test_cache_misses_follow_arrival_rate(fixture_path):
+    # 全部同時到達：每個工作階段都在第一筆結果可用前未命中
+    assert run_benchmark(fixture_path, sessions=10, speedup=0, trace_memory=False)["upstream_reads"] == 10
+    # 依錄製間隔到達（2 秒 > 上游 1 秒）：每個日期只讀取一次
+    assert run_benchmark(fixture_path, sessions=10, speedup=1, trace_memory=False)["upstream_reads"] == 2
@@ -1,3 +1,4 @@
+import re
 import streamlit as st
 
 def inject_custom_css():
@@ -284,10 +285,73 @@ def is_pwa():
     """
     return st.session_state.get("is_pwa", False)
 
+_CLIENT_TOKEN_RE = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+def inject_client_token():
+    """
+    Inject JavaScript that keeps a per-browser client token in localStorage and
+    mirrors it into the `client` URL parameter, so the server can restore view state.
+    The URL is updated with history.replaceState (no reload), so on a fresh launch the
+    token only reaches Streamlit with the next rerun.
+    A browser without a stored token always gets a new one, even when the URL already
+    carries a `client` parameter (e.g. a shared link), so two browsers never share state.
+    Returns the token from the URL, or None if it is not available yet.
+    """
+    st.components.v1.html(
+        """
+        <script>
+        (function() {
+            const KEY = 'newsClientToken';
+            const url = new URL(window.parent.location.href);
+            const urlToken = url.searchParams.get('client');
+            let token = localStorage.getItem(KEY);
+
+            if (!token) {
+                // Never adopt the URL token: it may come from a link copied from another browser
+                token = (window.crypto && crypto.randomUUID
+                    ? crypto.randomUUID()
+                    : Date.now().toString(36) + '-' + Math.random().toString(36).slice(2));
+                localStorage.setItem(KEY, token);
+            }
+
+            // Add the token to the URL without reloading; Streamlit sends it with the next rerun
+            if (urlToken !== token) {
+                url.searchParams.set('client', token);
+                window.parent.history.replaceState({}, '', url);
+            }
+        })();
+        </script>
+        """,
+        height=0,
+    )
+
+    # Follow the query string on every rerun: the first run of a shared link still sees
+    # the sender's token, which the script above replaces with this browser's own token
+    token = None
+    try:
+        if hasattr(st, 'query_params'):
+            token = st.query_params.get('client')
+    except Exception:
+        token = None
+    if token and _CLIENT_TOKEN_RE.match(token):
+        st.session_state.client_token = token
+    return st.session_state.get("client_token")
+
 def log_to_console(message):
     """
     Log a message to the browser console using JavaScript.
+    Does nothing outside a Streamlit script run (e.g. in replay_benchmark.py).
     """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        try:
+            ctx = get_script_run_ctx(suppress_warning=True)
+        except TypeError:  # Older Streamlit without suppress_warning
+            ctx = get_script_run_ctx()
+        if ctx is None:
+            return
+    except ImportError:
+        pass
     # Escape quotes to prevent JS errors
     safe_message = message.replace('"', '\\"').replace("'", "\\'")
     js_code = f"""
@@ -0,0 +1,65 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STATE_DB = "news_state.sqlite3"
+
+# 每位使用者最多保留幾天的已讀紀錄
+MAX_READ_DATES = 30
+
+
+class ViewStateStore:
+    """
+    以 client token 為鍵的檢視狀態儲存（SQLite，每位使用者一列精簡 JSON）。
+    狀態內容：最後瀏覽日期、游標所在的 sno、排序／篩選設定、各日期已讀的 sno。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS view_state ("
+                "token TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def load(self, token):
+        """一次查詢取回狀態，不存在時回傳 None。"""
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM view_state WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+
+    def save(self, token, state):
+        data = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO view_state (token, state, updated_at) VALUES (?, ?, ?)",
+                (token, data, time.time()),
+            )
+
+
+def compact_read_snos(read_snos):
+    """將 {日期: set(sno)} 轉為可儲存的格式，只保留最近 MAX_READ_DATES 天。"""
+    recent_dates = sorted(read_snos, reverse=True)[:MAX_READ_DATES]
+    return {date_str: sorted(read_snos[date_str], key=str) for date_str in recent_dates}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_view_state_store():
+    """行程內共用的狀態儲存，路徑可由 NEWS_STATE_DB 設定。"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ViewStateStore(os.environ.get("NEWS_STATE_DB", DEFAULT_STATE_DB))
+        return _default_store